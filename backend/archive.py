@@ -0,0 +1,72 @@
+# 留言归档工具
+# 将超过保留期的留言连同点赞和评论分批移到归档表，归档留言保留点赞数和评论数汇总
+# 工作表（messages、likes、comments）只保留近期数据，索引和扫描范围保持较小
+# 手动执行：python archive.py --days 90
+from database import Base, engine, SessionLocal
+from models import Message, Like, Comment, ArchivedMessage, ArchivedLike, ArchivedComment, BEIJING_TZ
+from cache import liked_cache
+from sqlalchemy import insert, select, func
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+import argparse
+import time
+import os
+# 加载.env文件
+load_dotenv()
+# 留言保留天数，超过后归档
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+# 每个事务归档的留言数
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+# 归档早于max_age_days天的留言，返回归档的留言数
+def archive_old_messages(db, max_age_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+  # 数据库中保存的是不带时区的北京时间
+  cutoff = datetime.now(BEIJING_TZ).replace(tzinfo=None) - timedelta(days=max_age_days)
+  archived = 0
+  while True:
+    ids = [row[0] for row in db.query(Message.id).filter(
+      Message.created_at < cutoff
+    ).order_by(Message.id).limit(batch_size)]
+    if not ids:
+      return archived
+    _archive_batch(db, ids)
+    archived += len(ids)
+
+# 归档一批留言（一个事务）
+def _archive_batch(db, ids: list):
+  likes_count = select(func.count(Like.id)).where(Like.message_id == Message.id).scalar_subquery()
+  comments_count = select(func.count(Comment.id)).where(Comment.message_id == Message.id).scalar_subquery()
+  db.execute(insert(ArchivedMessage).from_select(
+    ["id", "content", "author_id", "created_at", "likes_count", "comments_count"],
+    select(Message.id, Message.content, Message.author_id, Message.created_at,
+           likes_count, comments_count).where(Message.id.in_(ids))
+  ))
+  db.execute(insert(ArchivedLike).from_select(
+    ["id", "user_id", "message_id", "created_at"],
+    select(Like.id, Like.user_id, Like.message_id, Like.created_at).where(Like.message_id.in_(ids))
+  ))
+  db.execute(insert(ArchivedComment).from_select(
+    ["id", "content", "author_id", "message_id", "created_at"],
+    select(Comment.id, Comment.content, Comment.author_id, Comment.message_id,
+           Comment.created_at).where(Comment.message_id.in_(ids))
+  ))
+  # 工作表中的点赞和评论由外键级联删除
+  db.query(Message).filter(Message.id.in_(ids)).delete(synchronize_session=False)
+  db.commit()
+  liked_cache.discard_messages(ids)
+
+def main():
+  parser = argparse.ArgumentParser(description="归档旧留言")
+  parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="归档早于该天数的留言")
+  args = parser.parse_args()
+  Base.metadata.create_all(bind=engine)
+  started = time.perf_counter()
+  db = SessionLocal()
+  try:
+    archived = archive_old_messages(db, args.days)
+  finally:
+    db.close()
+  print(f"已归档 {archived} 条留言，耗时 {time.perf_counter() - started:.2f} 秒")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,138 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from dotenv import load_dotenv
+from database import SessionLocal
+from models import Like
+import threading
+import sys
+import os
+# 加载.env文件
+load_dotenv()
+# 所有用户点赞集合合计最多缓存的留言ID数量（每个ID占4字节）
+LIKED_CACHE_MAX_IDS = int(os.getenv("LIKED_CACHE_MAX_IDS", "1000000"))
+
+# 用户点赞集合缓存
+# 每个用户的已点赞留言ID保存为升序的array('I')，首次访问时用一条SQL加载
+# 判断是否点赞为二分查找，整页留言只需内存判断，不再逐条查询likes表
+# 使用LRU淘汰，按缓存的ID总数限制内存占用
+# 集合始终从主库加载，避免读副本的延迟数据被长期缓存
+class LikedSetCache:
+  def __init__(self, max_ids: int = LIKED_CACHE_MAX_IDS):
+    self.max_ids = max_ids
+    self._sets: "OrderedDict[int, array]" = OrderedDict()
+    self._total_ids = 0
+    self._lock = threading.Lock()
+
+  # 获取用户的点赞集合，未缓存时从主库加载
+  def get(self, user_id: int) -> array:
+    with self._lock:
+      liked = self._sets.get(user_id)
+      if liked is not None:
+        self._sets.move_to_end(user_id) # 标记为最近使用
+        return liked
+    db = SessionLocal()
+    try:
+      rows = db.query(Like.message_id).filter(
+        Like.user_id == user_id
+      ).order_by(Like.message_id).all()
+    finally:
+      db.close()
+    liked = array("I", (row[0] for row in rows))
+    with self._lock:
+      old = self._sets.pop(user_id, None)
+      if old is not None:
+        self._total_ids -= len(old)
+      self._sets[user_id] = liked
+      self._total_ids += len(liked)
+      self._evict()
+    return liked
+
+  # 批量判断一页留言是否已被该用户点赞
+  def liked_among(self, user_id: int, message_ids) -> set:
+    liked = self.get(user_id)
+    return {message_id for message_id in message_ids if _contains(liked, message_id)}
+
+  # 点赞后更新缓存（仅在已加载时更新，未加载的下次访问会从数据库读取）
+  def add(self, user_id: int, message_id: int):
+    with self._lock:
+      liked = self._sets.get(user_id)
+      if liked is None:
+        return
+      index = bisect_left(liked, message_id)
+      if index < len(liked) and liked[index] == message_id:
+        return
+      liked.insert(index, message_id)
+      self._total_ids += 1
+      self._evict()
+
+  # 取消点赞后更新缓存
+  def discard(self, user_id: int, message_id: int):
+    with self._lock:
+      liked = self._sets.get(user_id)
+      if liked is None:
+        return
+      index = bisect_left(liked, message_id)
+      if index < len(liked) and liked[index] == message_id:
+        del liked[index]
+        self._total_ids -= 1
+
+  # 留言被删除后从所有已缓存的集合中移除
+  def discard_message(self, message_id: int):
+    with self._lock:
+      for liked in self._sets.values():
+        index = bisect_left(liked, message_id)
+        if index < len(liked) and liked[index] == message_id:
+          del liked[index]
+          self._total_ids -= 1
+
+  # 批量删除留言后从所有已缓存的集合中移除
+  def discard_messages(self, message_ids):
+    removed = set(message_ids)
+    with self._lock:
+      for user_id, liked in self._sets.items():
+        kept = array("I", (message_id for message_id in liked if message_id not in removed))
+        if len(kept) != len(liked):
+          self._total_ids -= len(liked) - len(kept)
+          self._sets[user_id] = kept
+
+  # 移除某个用户的缓存，下次访问时重新加载
+  def invalidate(self, user_id: int):
+    with self._lock:
+      liked = self._sets.pop(user_id, None)
+      if liked is not None:
+        self._total_ids -= len(liked)
+
+  # 清空缓存（批量操作后使用）
+  def clear(self):
+    with self._lock:
+      self._sets.clear()
+      self._total_ids = 0
+
+  # 缓存统计信息，用于估算每个用户的内存占用
+  def stats(self) -> dict:
+    with self._lock:
+      users = len(self._sets)
+      # getsizeof包含数组对象头和预分配空间
+      memory_bytes = sum(sys.getsizeof(liked) for liked in self._sets.values())
+      return {
+        "users": users,
+        "total_ids": self._total_ids,
+        "max_ids": self.max_ids,
+        "memory_bytes": memory_bytes,
+        "bytes_per_user": memory_bytes / users if users else 0
+      }
+
+  # 超出容量时淘汰最久未使用的用户，至少保留最近使用的一个
+  def _evict(self):
+    while self._total_ids > self.max_ids and len(self._sets) > 1:
+      _, liked = self._sets.popitem(last=False)
+      self._total_ids -= len(liked)
+
+# 二分查找判断ID是否在升序数组中
+def _contains(liked: array, message_id: int) -> bool:
+  index = bisect_left(liked, message_id)
+  return index < len(liked) and liked[index] == message_id
+
+# 全局缓存实例
+liked_cache = LikedSetCache()
@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine,event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
+import sqlite3
+import time
 import os
 # 加载.env文件
 load_dotenv()
@@ -14,11 +17,183 @@ engine = create_engine(
   connect_args={"check_same_thread": False}
 )
 
+# SQLite默认不检查外键，每个连接开启外键约束，由数据库完成级联删除
+@event.listens_for(engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  cursor = dbapi_connection.cursor()
+  cursor.execute("PRAGMA foreign_keys=ON")
+  cursor.close()
+
 # 创建会话工厂，支持同时多线程进行SQL操作
 # autocommit 事务自动提交关闭（优化效率）
 # autoflush 提交事务后自动刷新关闭,
 # 关联数据库bind=engine
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 只读数据库（读副本），未配置时读请求也使用主库
+# 例如同一文件的只读连接 sqlite:///file:liuyan.db?mode=ro&uri=true
+# 或定期从主库复制的快照文件 sqlite:///./liuyan_read.db
+SQLALCHEMY_DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# 快照文件的刷新间隔（秒），0表示不刷新（读副本与主库为同一文件时）
+READ_SNAPSHOT_INTERVAL = float(os.getenv("READ_SNAPSHOT_INTERVAL", "0"))
+# 用户写入后该时间（秒）内的读请求仍走主库，保证能读到自己刚写入的数据
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+if SQLALCHEMY_DATABASE_READ_URL:
+  read_engine = create_engine(
+    SQLALCHEMY_DATABASE_READ_URL,
+    connect_args={"check_same_thread": False}
+  )
+
+  # 主库使用WAL模式，读连接不会阻塞写入
+  @event.listens_for(engine, "connect")
+  def enable_sqlite_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+  # 读连接禁止写入
+  @event.listens_for(read_engine, "connect")
+  def enable_sqlite_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+else:
+  read_engine = engine
+
+# 只读会话工厂
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 # ORM的基础类
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+# 最近写入过的用户及写入时间，用于读己之写
+_recent_writers = {}
+# 最近一次完成的快照开始复制的时间，此前提交的写入都已包含在快照中
+_snapshot_covers_until = None
+
+# 记录用户写入
+def mark_user_write(user_id):
+  _recent_writers[str(user_id)] = time.monotonic()
+  # 清理已不需要走主库的记录，避免无限增长
+  if len(_recent_writers) > 10000:
+    for key in list(_recent_writers):
+      if not wrote_recently(key):
+        del _recent_writers[key]
+
+# 判断用户的写入是否可能还读不到，是则读请求应走主库
+# 快照模式下直到一份在写入之后开始的快照完成前都走主库，
+# 同一文件的只读连接没有延迟，只需固定的时间窗口
+def wrote_recently(user_id) -> bool:
+  written_at = _recent_writers.get(str(user_id))
+  if written_at is None:
+    return False
+  if time.monotonic() - written_at <= READ_YOUR_WRITES_SECONDS:
+    return True
+  if READ_SNAPSHOT_INTERVAL > 0:
+    return _snapshot_covers_until is None or written_at >= _snapshot_covers_until
+  return False
+
+# 将主库复制到读副本快照文件（SQLite在线备份，不阻塞写入）
+def refresh_read_snapshot():
+  global _snapshot_covers_until
+  if read_engine is engine:
+    return
+  path = make_url(SQLALCHEMY_DATABASE_READ_URL).database
+  if path.startswith("file:"):
+    path = path[len("file:"):].split("?")[0]
+  started = time.monotonic()
+  source = engine.raw_connection()
+  target = sqlite3.connect(path)
+  try:
+    source.driver_connection.backup(target)
+  finally:
+    target.close()
+    source.close()
+  _snapshot_covers_until = started
+
+# 为已有数据库补充新增字段（create_all不会修改已存在的表）
+# 返回True表示本次新增了字段，需要回填数据
+def ensure_column(table: str, column: str, ddl: str) -> bool:
+  with engine.begin() as conn:
+    columns = [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")]
+    if column in columns:
+      return False
+    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+  return True
+
+# 为已有数据库补充ORM中新增的索引
+def ensure_indexes(table: str):
+  for index in Base.metadata.tables[table].indexes:
+    index.create(engine, checkfirst=True)
+
+# 已有数据库的表定义与ORM不一致时按新定义重建（SQLite不支持修改外键和AUTOINCREMENT）
+# 检查外键的ON DELETE规则和主键是否为AUTOINCREMENT，重建时丢弃父记录已不存在的孤儿数据
+def ensure_table_schema(table: str):
+  model_table = Base.metadata.tables[table]
+  raw = engine.raw_connection()
+  try:
+    cursor = raw.cursor()
+    # 每行格式: id, seq, table, from, to, on_update, on_delete, match
+    foreign_keys = cursor.execute(f"PRAGMA foreign_key_list({table})").fetchall()
+    actual_ondelete = {row[3]: row[6] for row in foreign_keys}
+    wanted_ondelete = {
+      foreign_key.parent.name: (foreign_key.ondelete or "NO ACTION").upper()
+      for foreign_key in model_table.foreign_keys
+    }
+    table_sql = cursor.execute(
+      "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone()[0]
+    wanted_autoincrement = bool(model_table.dialect_options["sqlite"]["autoincrement"])
+    if actual_ondelete == wanted_ondelete and ("AUTOINCREMENT" in table_sql.upper()) == wanted_autoincrement:
+      return
+    old_table = f"_{table}_old"
+    columns = ", ".join(row[1] for row in cursor.execute(f"PRAGMA table_info({table})"))
+    indexes = [row[0] for row in cursor.execute(
+      "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,)
+    )]
+    orphan_filter = " AND ".join(
+      f"{row[3]} IN (SELECT {row[4]} FROM {row[2]})" for row in foreign_keys
+    ) or "1"
+    # 重建期间关闭外键检查（必须在事务外设置）
+    # legacy_alter_table使重命名时不改写其他表中引用本表的外键
+    cursor.execute("PRAGMA foreign_keys=OFF")
+    cursor.execute("PRAGMA legacy_alter_table=ON")
+    cursor.execute("BEGIN")
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+    for index in indexes:
+      cursor.execute(f"DROP INDEX {index}")
+    for statement in _create_statements(table):
+      cursor.execute(statement)
+    cursor.execute(
+      f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old_table} WHERE {orphan_filter}"
+    )
+    cursor.execute(f"DROP TABLE {old_table}")
+    cursor.execute("COMMIT")
+    cursor.execute("PRAGMA legacy_alter_table=OFF")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+  finally:
+    raw.close()
+
+# AUTOINCREMENT表的自增起点不低于归档表中的最大ID，避免新记录复用已归档记录的ID
+def ensure_sequence_floor(table: str, archive_table: str):
+  with engine.begin() as conn:
+    floor = conn.exec_driver_sql(
+      f"SELECT MAX(COALESCE((SELECT MAX(id) FROM {table}), 0), COALESCE((SELECT MAX(id) FROM {archive_table}), 0))"
+    ).scalar()
+    current = conn.exec_driver_sql(
+      "SELECT seq FROM sqlite_sequence WHERE name=?", (table,)
+    ).scalar()
+    if current is None:
+      conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, floor))
+    elif current < floor:
+      conn.exec_driver_sql("UPDATE sqlite_sequence SET seq=? WHERE name=?", (floor, table))
+
+# 根据ORM定义生成建表和建索引语句
+def _create_statements(table: str) -> list:
+  from sqlalchemy.schema import CreateTable, CreateIndex
+  model_table = Base.metadata.tables[table]
+  statements = [str(CreateTable(model_table).compile(engine))]
+  statements += [str(CreateIndex(index).compile(engine)) for index in model_table.indexes]
+  return statements
@@ -0,0 +1,206 @@
+from collections import deque
+from database import SessionLocal
+from models import JobRecord
+from dotenv import load_dotenv
+import asyncio
+import inspect
+import json
+import time
+import os
+# 加载.env文件
+load_dotenv()
+# 后台任务队列配置
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4")) # 工作协程数量
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000")) # 队列容量
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "3")) # 失败重试次数
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "0.5")) # 首次重试等待秒数，之后翻倍
+JOB_PERSIST = os.getenv("JOB_PERSIST", "1") == "1" # 是否将任务持久化到jobs表
+
+# 队列已满
+class JobQueueFull(Exception):
+  pass
+
+# 进程内后台任务队列
+# 请求处理函数通过enqueue提交延后执行的工作后立即返回，由工作协程池执行
+# 同步任务函数放到线程池中执行，避免阻塞事件循环
+# 开启持久化时任务先写入jobs表，完成后删除，重启后继续执行未完成的任务
+class JobQueue:
+  def __init__(self, workers: int = JOB_WORKERS, maxsize: int = JOB_QUEUE_SIZE,
+               max_retries: int = JOB_MAX_RETRIES, retry_delay: float = JOB_RETRY_DELAY,
+               persist: bool = JOB_PERSIST):
+    self.workers = workers
+    self.maxsize = maxsize
+    self.max_retries = max_retries
+    self.retry_delay = retry_delay
+    self.persist = persist
+    self._handlers = {}
+    self._queue = None
+    self._tasks = []
+    self._accepting = False
+    self._in_flight = 0
+    self._completed = 0
+    self._failed = 0
+    self._retried = 0
+    self._latencies = deque(maxlen=1000) # 最近任务从入队到完成的耗时
+
+  # 注册任务处理函数
+  def register(self, name: str):
+    def decorator(func):
+      self._handlers[name] = func
+      return func
+    return decorator
+
+  # 提交任务，persist为False时不写入jobs表（如负载不可JSON序列化）
+  def enqueue(self, name: str, payload: dict, persist: bool = True):
+    if name not in self._handlers:
+      raise KeyError(f"未注册的任务: {name}")
+    if not self._accepting or self._queue.full():
+      raise JobQueueFull()
+    record_id = None
+    if self.persist and persist:
+      record_id = self._save_record(name, payload)
+    self._queue.put_nowait({
+      "name": name,
+      "payload": payload,
+      "record_id": record_id,
+      "enqueued_at": time.monotonic()
+    })
+
+  # 启动工作协程，并恢复上次未完成的持久化任务
+  async def start(self):
+    self._queue = asyncio.Queue(maxsize=self.maxsize)
+    self._accepting = True
+    if self.persist:
+      for record in self._load_pending():
+        if self._queue.full():
+          break
+        self._queue.put_nowait({
+          "name": record.name,
+          "payload": json.loads(record.payload),
+          "record_id": record.id,
+          "enqueued_at": time.monotonic()
+        })
+    self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+  # 停止接收新任务，等待队列中的任务执行完毕后关闭
+  # 超时未完成的持久化任务保留在jobs表中，下次启动继续执行
+  async def stop(self, timeout: float = 10.0):
+    self._accepting = False
+    if self._queue is None:
+      return
+    try:
+      await asyncio.wait_for(self._queue.join(), timeout)
+    except asyncio.TimeoutError:
+      pass
+    for task in self._tasks:
+      task.cancel()
+    await asyncio.gather(*self._tasks, return_exceptions=True)
+    self._tasks = []
+
+  # 队列监控指标
+  def stats(self) -> dict:
+    latencies = sorted(self._latencies)
+    return {
+      "depth": self._queue.qsize() if self._queue else 0,
+      "capacity": self.maxsize,
+      "in_flight": self._in_flight,
+      "completed": self._completed,
+      "failed": self._failed,
+      "retried": self._retried,
+      "latency_avg_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0,
+      "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2) if latencies else 0
+    }
+
+  # 工作协程，单个任务出错（如更新jobs表时数据库被锁）不会导致协程退出
+  # _run已经记为完成或失败的任务不再重复计数
+  async def _worker(self):
+    while True:
+      job = await self._queue.get()
+      self._in_flight += 1
+      try:
+        await self._run(job)
+      except asyncio.CancelledError:
+        raise
+      except Exception as error:
+        if not job.get("counted"):
+          self._failed += 1
+        print(f"后台任务处理异常 {job['name']}: {error!r}")
+      finally:
+        self._in_flight -= 1
+        self._queue.task_done()
+
+  # 执行任务，失败后按指数退避重试
+  async def _run(self, job):
+    handler = self._handlers.get(job["name"])
+    if handler is None:
+      # 持久化的旧任务可能已不再注册
+      self._failed += 1
+      job["counted"] = True
+      if job["record_id"] is not None:
+        await asyncio.to_thread(self._mark_failed, job["record_id"], "未注册的任务")
+      return
+    for attempt in range(self.max_retries + 1):
+      try:
+        if inspect.iscoroutinefunction(handler):
+          await handler(**job["payload"])
+        else:
+          await asyncio.to_thread(handler, **job["payload"])
+      except asyncio.CancelledError:
+        raise
+      except Exception as error:
+        if attempt < self.max_retries:
+          self._retried += 1
+          await asyncio.sleep(self.retry_delay * (2 ** attempt))
+          continue
+        self._failed += 1
+        job["counted"] = True
+        print(f"后台任务执行失败 {job['name']}: {error!r}")
+        if job["record_id"] is not None:
+          await asyncio.to_thread(self._mark_failed, job["record_id"], repr(error))
+        return
+      self._completed += 1
+      job["counted"] = True
+      self._latencies.append(time.monotonic() - job["enqueued_at"])
+      if job["record_id"] is not None:
+        await asyncio.to_thread(self._delete_record, job["record_id"])
+      return
+
+  def _save_record(self, name: str, payload: dict) -> int:
+    db = SessionLocal()
+    try:
+      record = JobRecord(name=name, payload=json.dumps(payload))
+      db.add(record)
+      db.commit()
+      return record.id
+    finally:
+      db.close()
+
+  def _load_pending(self) -> list:
+    db = SessionLocal()
+    try:
+      return db.query(JobRecord).filter(
+        JobRecord.status == "pending"
+      ).order_by(JobRecord.id).all()
+    finally:
+      db.close()
+
+  def _delete_record(self, record_id: int):
+    db = SessionLocal()
+    try:
+      db.query(JobRecord).filter(JobRecord.id == record_id).delete()
+      db.commit()
+    finally:
+      db.close()
+
+  def _mark_failed(self, record_id: int, error: str):
+    db = SessionLocal()
+    try:
+      db.query(JobRecord).filter(JobRecord.id == record_id).update(
+        {"status": "failed", "error": error}
+      )
+      db.commit()
+    finally:
+      db.close()
+
+# 全局任务队列实例
+job_queue = JobQueue()
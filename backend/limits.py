@@ -0,0 +1,163 @@
+from collections import deque
+from starlette.responses import JSONResponse
+from dotenv import load_dotenv
+import asyncio
+import time
+import os
+# 加载.env文件
+load_dotenv()
+# 全局最大并发请求数
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "100"))
+# 各类接口的最大并发数（登录注册的密码哈希开销大，管理员接口包含批量操作）
+ROUTE_LIMITS = {
+  "auth": int(os.getenv("LIMIT_AUTH", "10")),
+  "writes": int(os.getenv("LIMIT_WRITES", "30")),
+  "reads": int(os.getenv("LIMIT_READS", "80")),
+  "admin": int(os.getenv("LIMIT_ADMIN", "5"))
+}
+# 各类接口的处理超时（秒），超时后取消处理
+ROUTE_TIMEOUTS = {
+  "auth": float(os.getenv("TIMEOUT_AUTH", "10")),
+  "writes": float(os.getenv("TIMEOUT_WRITES", "10")),
+  "reads": float(os.getenv("TIMEOUT_READS", "10")),
+  "admin": float(os.getenv("TIMEOUT_ADMIN", "120"))
+}
+# 排队等待的最长时间（秒），超过后直接返回503
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "0.5"))
+# 503响应中建议客户端重试的等待秒数
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "1"))
+
+# 根据请求方法和路径划分接口类别
+def classify_route(method: str, path: str) -> str:
+  if path in ("/api/login", "/api/register"):
+    return "auth"
+  if path.startswith("/api/admin"):
+    return "admin"
+  if method in ("GET", "HEAD"):
+    return "reads"
+  return "writes"
+
+# 在timeout秒内获取信号量，超时抛出TimeoutError
+# 有空闲名额时直接获取，不经过wait_for（超时为0时wait_for会在获取前就取消）
+async def _acquire_within(semaphore: asyncio.Semaphore, timeout: float):
+  if not semaphore.locked():
+    await semaphore.acquire()
+    return
+  if timeout <= 0:
+    raise asyncio.TimeoutError()
+  await asyncio.wait_for(semaphore.acquire(), timeout)
+
+# 并发限制器
+# 先获取接口类别的名额再获取全局名额，排队总时长不超过QUEUE_TIMEOUT
+# 排队人数已达上限时直接拒绝，不再等待
+class ConcurrencyLimiter:
+  def __init__(self, max_concurrent: int = MAX_CONCURRENT_REQUESTS, route_limits: dict = ROUTE_LIMITS,
+               route_timeouts: dict = ROUTE_TIMEOUTS, queue_timeout: float = QUEUE_TIMEOUT):
+    self.max_concurrent = max_concurrent
+    self.route_limits = route_limits
+    self.route_timeouts = route_timeouts
+    self.queue_timeout = queue_timeout
+    self._global = asyncio.Semaphore(max_concurrent)
+    self._routes = {name: asyncio.Semaphore(limit) for name, limit in route_limits.items()}
+    self._stats = {name: {
+      "in_flight": 0,
+      "waiting": 0,
+      "admitted": 0,
+      "shed": 0,
+      "timed_out": 0,
+      "waits": deque(maxlen=1000) # 最近请求的排队耗时
+    } for name in route_limits}
+
+  # 获取名额，成功返回True，排队超时或队列已满返回False
+  async def acquire(self, route: str) -> bool:
+    stats = self._stats[route]
+    # 排队人数超过该类接口的并发数时直接拒绝
+    if stats["waiting"] >= self.route_limits[route]:
+      stats["shed"] += 1
+      return False
+    started = time.monotonic()
+    stats["waiting"] += 1
+    try:
+      await _acquire_within(self._routes[route], self.queue_timeout)
+      try:
+        remaining = max(0.0, self.queue_timeout - (time.monotonic() - started))
+        await _acquire_within(self._global, remaining)
+      except asyncio.TimeoutError:
+        self._routes[route].release()
+        raise
+    except asyncio.TimeoutError:
+      stats["shed"] += 1
+      return False
+    finally:
+      stats["waiting"] -= 1
+    stats["waits"].append(time.monotonic() - started)
+    stats["admitted"] += 1
+    stats["in_flight"] += 1
+    return True
+
+  def release(self, route: str):
+    self._stats[route]["in_flight"] -= 1
+    self._global.release()
+    self._routes[route].release()
+
+  def record_timeout(self, route: str):
+    self._stats[route]["timed_out"] += 1
+
+  # 并发与排队指标
+  def stats(self) -> dict:
+    result = {"max_concurrent": self.max_concurrent, "routes": {}}
+    for name, stats in self._stats.items():
+      waits = sorted(stats["waits"])
+      result["routes"][name] = {
+        "limit": self.route_limits[name],
+        "in_flight": stats["in_flight"],
+        "waiting": stats["waiting"],
+        "admitted": stats["admitted"],
+        "shed": stats["shed"],
+        "timed_out": stats["timed_out"],
+        "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0,
+        "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0
+      }
+    return result
+
+# 并发限制与降载中间件（ASGI）
+# 只作用于/api接口，名额不足时返回503和Retry-After，处理超时时取消处理并返回504
+class ConcurrencyLimitMiddleware:
+  def __init__(self, app, limiter: ConcurrencyLimiter):
+    self.app = app
+    self.limiter = limiter
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith("/api"):
+      await self.app(scope, receive, send)
+      return
+    route = classify_route(scope["method"], scope["path"])
+    if not await self.limiter.acquire(route):
+      response = JSONResponse(
+        {"detail": "服务繁忙，请稍后再试"},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+      )
+      await response(scope, receive, send)
+      return
+
+    response_started = False
+    async def send_wrapper(message):
+      nonlocal response_started
+      if message["type"] == "http.response.start":
+        response_started = True
+      await send(message)
+
+    try:
+      await asyncio.wait_for(self.app(scope, receive, send_wrapper), self.limiter.route_timeouts[route])
+    except asyncio.TimeoutError:
+      self.limiter.record_timeout(route)
+      # 已经开始发送响应时无法再改为超时响应
+      if not response_started:
+        response = JSONResponse({"detail": "请求处理超时"}, status_code=504)
+        await response(scope, receive, send)
+    finally:
+      self.limiter.release(route)
+
+# 全局并发限制器实例
+limiter = ConcurrencyLimiter()
@@ -1,8 +1,16 @@
-from fastapi import FastAPI,Depends, HTTPException,status,UploadFile,File
-from database import Base,engine,SessionLocal
-from models import User,UserRole,Message,Like,Comment
+from fastapi import FastAPI,Depends, HTTPException,status,UploadFile,File,Query,Request
+from database import (Base,engine,SessionLocal,ReadSessionLocal,ensure_column,ensure_indexes,ensure_table_schema,
+                      ensure_sequence_floor,mark_user_write,wrote_recently,refresh_read_snapshot,READ_SNAPSHOT_INTERVAL)
+from models import User,UserRole,Message,Like,Comment,ArchivedMessage,ArchivedLike,ArchivedComment
 from auth import get_password_hash,verify_token,verify_password,create_access_token
+from cache import liked_cache
+from jobs import job_queue,JobQueueFull
+from archive import archive_old_messages,ARCHIVE_AFTER_DAYS
+from moderation import delete_messages,purge_user_content
+from limits import ConcurrencyLimitMiddleware,limiter
+from ranking import add_event,remove_event,rebuild_hot_scores,LIKE_WEIGHT,COMMENT_WEIGHT
 from pathlib import Path
+from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html,get_swagger_ui_oauth2_redirect_html
@@ -10,13 +18,32 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from schemas import (UserCreate, UserResponse, UserLogin, UserUpdate,
                       MessageResponse, MessageCreate, CommentResponse,CommentCreate
-                      ,AdminUserResponse,AdminUserUpdate)
+                      ,AdminUserResponse,AdminUserUpdate,BulkDeleteMessages,BulkDeleteResponse)
+from typing import Optional
+import asyncio
 import uuid
 import uvicorn
 import json
 # 创建所有数据库表
 Base.metadata.create_all(bind=engine)
 
+# 旧数据库升级：补充热度字段并根据已有点赞评论回填
+if ensure_column("messages", "hot_score", "FLOAT"):
+  upgrade_db = SessionLocal()
+  try:
+    rebuild_hot_scores(upgrade_db)
+  finally:
+    upgrade_db.close()
+# 旧数据库升级：补充索引，点赞和评论表外键改为级联删除，主键改为AUTOINCREMENT
+ensure_indexes("messages")
+ensure_table_schema("messages")
+ensure_table_schema("likes")
+ensure_table_schema("comments")
+# 自增起点不低于归档表最大ID（也覆盖导入归档数据后的情况）
+ensure_sequence_floor("messages", "archived_messages")
+ensure_sequence_floor("likes", "archived_likes")
+ensure_sequence_floor("comments", "archived_comments")
+
 # 创建管理员账号
 def create_default_admin():
   # 创建一个数据库会话线程
@@ -51,18 +78,44 @@ UPLOAD_DIR = Path("uploads")
 # exist_ok 若文件存在则不创建，不存在则创建
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# 应用生命周期：启动后台任务队列，关闭时等待队列中的任务执行完毕
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  await job_queue.start()
+  snapshot_task = None
+  if READ_SNAPSHOT_INTERVAL > 0:
+    # 首次快照在开始处理请求前完成，避免读到不存在或为空的快照文件
+    await asyncio.to_thread(refresh_read_snapshot)
+    snapshot_task = asyncio.create_task(refresh_read_snapshot_periodically())
+  yield
+  if snapshot_task is not None:
+    snapshot_task.cancel()
+  await job_queue.stop()
+
+# 定期刷新读副本快照
+async def refresh_read_snapshot_periodically():
+  while True:
+    await asyncio.sleep(READ_SNAPSHOT_INTERVAL)
+    try:
+      await asyncio.to_thread(refresh_read_snapshot)
+    except Exception as error:
+      print(f"读副本快照刷新失败: {error!r}")
+
 # 创建FastAPI应用实例
 app = FastAPI(
   title="留言墙API",
   description="一个简单的留言墙API，支持用户注册、登录、留言、点赞和评论等功能。",
   version="1.0.0",
   docs_url=None,  # 禁用默认的Swagger UI
-  redoc_url=None  # 禁用默认的ReDoc UI
+  redoc_url=None,  # 禁用默认的ReDoc UI
+  lifespan=lifespan
 )
 
 # 服务器挂载静态文件
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.mount("/static", StaticFiles(directory="static"), name="static")
+# 添加并发限制中间件，过载时快速失败（在CORS之前添加，使503响应也带跨域头）
+app.add_middleware(ConcurrencyLimitMiddleware, limiter=limiter)
 # 添加CROS中间件，解决跨域问题
 app.add_middleware(
   CORSMiddleware,
@@ -74,6 +127,20 @@ app.add_middleware(
 
 # 安全提取token
 security = HTTPBearer()
+# 可选token（未登录也可访问的读接口）
+optional_security = HTTPBearer(auto_error=False)
+
+# 写请求成功后记录写入用户，之后短时间内该用户的读请求走主库
+@app.middleware("http")
+async def track_user_writes(request: Request, call_next):
+  response = await call_next(request)
+  if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+      payload = verify_token(authorization[len("Bearer "):])
+      if payload and payload.get("sub") is not None:
+        mark_user_write(payload["sub"])
+  return response
 
 # 数据库会话依赖
 def get_db():
@@ -83,6 +150,20 @@ def get_db():
   finally:
     db.close() # 关闭会话线程，释放资源
 
+# 只读数据库会话依赖，用于GET接口
+# 当前用户刚写入过数据时使用主库，保证读到自己的写入
+def get_read_db(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+  session_factory = ReadSessionLocal
+  if credentials is not None:
+    payload = verify_token(credentials.credentials)
+    if payload and wrote_recently(payload.get("sub")):
+      session_factory = SessionLocal
+  db = session_factory()
+  try:
+    yield db
+  finally:
+    db.close()
+
 # 获取当前用户  HTTPAuthorizationCredentials返回的类型  Session相当于一个sql的会话
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db:Session=Depends(get_db)):
   # 获取jwt token
@@ -119,6 +200,49 @@ def get_admin_user(current_user:User = Depends(get_current_user)):
     )
   return current_user
 
+# 保存上传的文件，先写临时文件再重命名，避免读到写了一半的文件
+def save_upload(file_path: Path, content: bytes):
+  tmp_path = file_path.with_name(file_path.name + ".tmp")
+  with open(tmp_path, "wb") as buffer:
+    buffer.write(content)
+  tmp_path.replace(file_path)
+
+# 批量删除和清理用户内容耗时较长，放到线程池中执行，避免阻塞事件循环
+# 会话不能跨线程使用，在线程内单独创建
+def run_delete_messages(criteria: list, message_ids: list) -> dict:
+  db = SessionLocal()
+  try:
+    return delete_messages(db, criteria, message_ids)
+  finally:
+    db.close()
+
+def run_purge_user_content(user_id: int) -> dict:
+  db = SessionLocal()
+  try:
+    return purge_user_content(db, user_id)
+  finally:
+    db.close()
+
+# 后台任务
+# 归档旧留言
+@job_queue.register("archive_messages")
+def archive_messages_job(max_age_days: int):
+  db = SessionLocal()
+  try:
+    archive_old_messages(db, max_age_days)
+  finally:
+    db.close()
+
+# 队列已满时返回503，提示客户端稍后重试
+def enqueue_job(name: str, payload: dict, persist: bool = True):
+  try:
+    job_queue.enqueue(name, payload, persist=persist)
+  except JobQueueFull:
+    raise HTTPException(
+      status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+      detail="服务繁忙，请稍后再试"
+    )
+
 @app.get("/")
 async def root():
   return {"message":"欢迎使用留言墙API服务！如需查看接口文档，请访问/docs"}
@@ -252,19 +376,10 @@ async def update_user_profile(
     is_active=current_user.is_active
   )
 
-# 留言信息页
-# 获取留言信息
-# 分页功能未实现（可优化）
-@app.get("/api/messages", response_model=list[MessageResponse])
-async def get_messages(
-  # skip为初始页数, limit为每页数量, 后端分页实现
-  # skip: int = 0,
-  # limit: int = 10,
-  current_user: User = Depends(get_current_user),
-  db: Session = Depends(get_db)
-):
-  # 获取留言列表 desc()按时间降序排列即最新的排在前面
-  messages = db.query(Message).order_by(Message.created_at.desc()).all()
+# 组装留言列表响应（点赞数、评论数、当前用户是否点赞）
+def build_message_responses(messages, current_user: User, db: Session) -> list[MessageResponse]:
+  # 一条SQL加载当前用户点赞集合，整页留言通过集合判断是否点赞
+  liked_ids = liked_cache.liked_among(current_user.id, [message.id for message in messages])
 
   result = []
   for message in messages:
@@ -273,14 +388,34 @@ async def get_messages(
     # 统计当前留言的评论数量
     comments_count = db.query(Comment).filter(Comment.message_id == message.id).count()
     # 判断当前用户是否已经点赞
-    is_liked = db.query(Like).filter(
-      # 该点赞数据是否已经存在
-      Like.message_id == message.id,
-      # 该点赞数据是否属于当前用户
-      Like.user_id == current_user.id
-    ).first() is not None
-
-  result.append(MessageResponse(
+    is_liked = message.id in liked_ids
+
+    result.append(MessageResponse(
+      id=message.id,
+      content=message.content,
+      created_at=message.created_at,
+      author=UserResponse(
+        id=message.author.id,
+        username=message.author.username,
+        nickname=message.author.nickname,
+        avatar=message.author.avatar,
+        role=message.author.role,
+        is_active=message.author.is_active
+      ),
+      likes_count=likes_count,
+      comments_count=comments_count,
+      is_liked=is_liked
+    ))
+  return result
+
+# 组装归档留言列表响应，点赞数和评论数使用归档时保存的汇总值
+def build_archived_message_responses(messages, current_user: User, db: Session) -> list[MessageResponse]:
+  # 一条SQL查出当前用户在本页归档留言中的点赞
+  liked_ids = {row[0] for row in db.query(ArchivedLike.message_id).filter(
+    ArchivedLike.user_id == current_user.id,
+    ArchivedLike.message_id.in_([message.id for message in messages])
+  )}
+  return [MessageResponse(
     id=message.id,
     content=message.content,
     created_at=message.created_at,
@@ -292,12 +427,51 @@ async def get_messages(
       role=message.author.role,
       is_active=message.author.is_active
     ),
-    likes_count=likes_count,
-    momments_count=comments_count,
-    is_liked=is_liked
-  ))
+    likes_count=message.likes_count,
+    comments_count=message.comments_count,
+    is_liked=message.id in liked_ids
+  )for message in messages
+  ]
+
+# 留言信息页
+# 获取留言信息
+# 分页时先取工作表中的近期留言，翻页超出后继续从归档表读取
+# 不传limit时只返回工作表中的留言
+@app.get("/api/messages", response_model=list[MessageResponse])
+async def get_messages(
+  # skip为跳过的条数, limit为每页数量, 后端分页实现
+  skip: int = Query(0, ge=0),
+  limit: Optional[int] = Query(None, ge=1, le=100),
+  current_user: User = Depends(get_current_user),
+  db: Session = Depends(get_read_db)
+):
+  # 获取留言列表 desc()按时间降序排列即最新的排在前面
+  query = db.query(Message).order_by(Message.created_at.desc())
+  if limit is None:
+    return build_message_responses(query.offset(skip).all(), current_user, db)
+
+  messages = query.offset(skip).limit(limit).all()
+  result = build_message_responses(messages, current_user, db)
+  if len(messages) < limit:
+    # 工作表已翻完，剩余部分从归档表中读取
+    archive_skip = max(0, skip - db.query(Message).count())
+    archived = db.query(ArchivedMessage).order_by(
+      ArchivedMessage.created_at.desc()
+    ).offset(archive_skip).limit(limit - len(messages)).all()
+    result += build_archived_message_responses(archived, current_user, db)
   return result
 
+# 获取热门留言
+# 热度分数在点赞、评论时增量更新，按索引取前limit条，无需全表排序
+@app.get("/api/messages/hot", response_model=list[MessageResponse])
+async def get_hot_messages(
+  limit: int = Query(20, ge=1, le=100),
+  current_user: User = Depends(get_current_user),
+  db: Session = Depends(get_read_db)
+):
+  messages = db.query(Message).order_by(Message.hot_score.desc()).limit(limit).all()
+  return build_message_responses(messages, current_user, db)
+
 # 创建留言
 @app.post("/api/messages",response_model=MessageResponse)
 async def create_message(
@@ -352,10 +526,9 @@ async def upload_file(
   unique_filename = f"{uuid.uuid4()}.{file_extension}"
   file_path = UPLOAD_DIR / unique_filename
 
-  # 保存文件 w表示写 b表示二进制 await异步读取
-  with open(file_path, "wb")as buffer:
-    content = await file.read()
-    buffer.write(content)
+  # 保存文件 await异步读取，在线程中写入磁盘，写入完成后再返回url
+  content = await file.read()
+  await asyncio.to_thread(save_upload, file_path, content)
 
   # 返回文件url
   file_url = f"/uploads/{unique_filename}"
@@ -384,7 +557,10 @@ async def toggle_like(
   if existing_like:
     # 已有点赞，再次点击则取消点赞
     db.delete(existing_like)
+    # 撤销该点赞对热度的贡献
+    message.hot_score = remove_event(message.hot_score, LIKE_WEIGHT, existing_like.created_at)
     db.commit()
+    liked_cache.discard(current_user.id, message_id)
     return {"liked":False,"message":"取消点赞"}
   else:
     # 未点赞则点赞
@@ -393,19 +569,25 @@ async def toggle_like(
       user_id = current_user.id
     )
     db.add(new_like)
+    # 增量更新热度
+    message.hot_score = add_event(message.hot_score, LIKE_WEIGHT)
     db.commit()
+    liked_cache.add(current_user.id, message_id)
     return {"liked":True, "message":"点赞成功"}
   
 # 获取留言评论信息
-@app.get("api/messages/{message_id}/comments", response_model=list[CommentResponse])
+@app.get("/api/messages/{message_id}/comments", response_model=list[CommentResponse])
 async def get_comments(
   message_id: int,
-  db: Session = Depends(get_db)
+  db: Session = Depends(get_read_db)
 ):
-  # 获取留言的评论列表
-  comments = db.query(Comment).filter(
-    Comment.message_id == message_id
-  ).order_by(Comment.created_at.desc()).all()
+  # 获取留言的评论列表，留言已归档时从归档表读取
+  model = Comment
+  if db.query(Message.id).filter(Message.id == message_id).first() is None:
+    model = ArchivedComment
+  comments = db.query(model).filter(
+    model.message_id == message_id
+  ).order_by(model.created_at.desc()).all()
 
   return [CommentResponse(
     id=comment.id,
@@ -446,6 +628,8 @@ async def create_comment(
   )
 
   db.add(db_comment)
+  # 增量更新热度
+  message.hot_score = add_event(message.hot_score, COMMENT_WEIGHT)
   db.commit()
   db.refresh(db_comment)
 
@@ -471,7 +655,7 @@ async def create_comment(
 async def admin_get_users(
   # 分页管理(未实现)
   admin_user: User = Depends(get_admin_user),
-  db: Session = Depends(get_db)
+  db: Session = Depends(get_read_db)
 ):
   # 获取用户列表
   users = db.query(User).all()
@@ -551,20 +735,74 @@ async def admin_delete_message(
       status_code=status.HTTP_404_NOT_FOUND,
       detail="留言不存在"
     )
-  # 删除相关的点赞和评论
-  db.query(Like).filter(Like.message_id == message_id).delete()
-  db.query(Comment).filter(Comment.message_id == message_id).delete()
-
+  # 相关的点赞和评论由外键级联删除
   db.delete(message)
   db.commit()
+  # 同步移除点赞集合缓存中的该留言
+  liked_cache.discard_message(message_id)
 
   return {"detail":"留言删除成功"}
 
+# 批量删除留言（按ID列表、作者、时间范围）
+@app.post("/api/admin/messages/bulk-delete", response_model=BulkDeleteResponse)
+async def admin_bulk_delete_messages(
+  bulk: BulkDeleteMessages,
+  admin_user: User = Depends(get_admin_user)
+):
+  criteria = []
+  if bulk.author_id is not None:
+    criteria.append(Message.author_id == bulk.author_id)
+  if bulk.start_time is not None:
+    criteria.append(Message.created_at >= bulk.start_time)
+  if bulk.end_time is not None:
+    criteria.append(Message.created_at < bulk.end_time)
+  # 不允许无条件删除全部留言
+  if not criteria and not bulk.message_ids:
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      detail="请至少提供一个删除条件"
+    )
+  result = await asyncio.to_thread(run_delete_messages, criteria, bulk.message_ids)
+  return BulkDeleteResponse(**result)
+
+# 封禁用户并清除其全部留言、点赞和评论
+@app.post("/api/admin/users/{user_id}/ban-purge", response_model=BulkDeleteResponse)
+async def admin_ban_purge_user(
+  user_id: int,
+  admin_user: User = Depends(get_admin_user),
+  db: Session = Depends(get_db)
+):
+  user = db.query(User).filter(User.id == user_id).first()
+  if not user:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND,
+      detail="用户不存在"
+    )
+  if user.id == admin_user.id:
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      detail="不可禁用自己的账号"
+    )
+  # 先禁用账号，阻止清理过程中继续发帖
+  user.is_active = False
+  db.commit()
+  result = await asyncio.to_thread(run_purge_user_content, user_id)
+  return BulkDeleteResponse(**result)
+
+# 提交归档任务，将超过保留期的留言移到归档表
+@app.post("/api/admin/archive")
+async def admin_archive_messages(
+  max_age_days: int = Query(ARCHIVE_AFTER_DAYS, ge=1),
+  admin_user: User = Depends(get_admin_user)
+):
+  enqueue_job("archive_messages", {"max_age_days": max_age_days})
+  return {"detail":"归档任务已提交"}
+
 # 获取统计信息
 @app.get("/api/admin/status")
 async def admin_get_status(
   admin_user: User = Depends(get_admin_user),
-  db: Session = Depends(get_db)
+  db: Session = Depends(get_read_db)
 ):
   # 统计信息
   total_users = db.query(User).count()
@@ -572,13 +810,26 @@ async def admin_get_status(
   total_messages = db.query(Message).count()
   total_likes = db.query(Like).count()
   total_comments = db.query(Comment).count()
+  archived_messages = db.query(ArchivedMessage).count()
 
   return{
     "total_users": total_users,
     "active_users": active_users,
     "total_messages": total_messages,
     "total_likes": total_likes,
-    "total_comments": total_comments
+    "total_comments": total_comments,
+    "archived_messages": archived_messages
+  }
+
+# 获取运行指标（缓存占用等）
+@app.get("/api/admin/metrics")
+async def admin_get_metrics(
+  admin_user: User = Depends(get_admin_user)
+):
+  return {
+    "liked_cache": liked_cache.stats(),
+    "job_queue": job_queue.stats(),
+    "concurrency": limiter.stats()
   }
 
 @app.get("/docs", include_in_schema=False)
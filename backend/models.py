@@ -2,8 +2,9 @@
 from datetime import timezone, timedelta, datetime
 import enum
 from database import Base
+from ranking import initial_hot_score
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer,String,Enum,Boolean,DateTime,Text,ForeignKey
+from sqlalchemy import Column, Integer,String,Enum,Boolean,DateTime,Text,ForeignKey,Float
 # 北京时区
 BEIJING_TZ = timezone(timedelta(hours=8))
 
@@ -29,32 +30,37 @@ class User(Base):
   # 关联留言
   messages = relationship("Message",back_populates="author")
   # 关联点赞
-  likes = relationship("Like", back_populates="user")
+  likes = relationship("Like", back_populates="user", passive_deletes=True)
   # 关联评论
-  comments = relationship("Comment", back_populates="author")
+  comments = relationship("Comment", back_populates="author", passive_deletes=True)
 
 # 留言表
 class Message(Base):
   __tablename__ = "messages"
+  # 使用AUTOINCREMENT，已归档记录的ID不会被新记录复用
+  __table_args__ = {"sqlite_autoincrement": True}
   id = Column(Integer, primary_key=True, index=True, comment="留言ID")
   content = Column(Text, nullable=False, comment="留言内容")
-  author_id = Column(Integer, ForeignKey("users.id"), nullable=False, comment="作者ID")
-  created_at = Column(DateTime, default=lambda:datetime.now(BEIJING_TZ), comment="创建时间")
+  author_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True, comment="作者ID")
+  created_at = Column(DateTime, default=lambda:datetime.now(BEIJING_TZ), index=True, comment="创建时间")
+  hot_score = Column(Float, default=initial_hot_score, index=True, comment="热度分数(对数形式)")
 
   # 关联用户
   author = relationship("User", back_populates="messages")
   # 关联点赞
-  likes = relationship("Like", back_populates="message")
+  likes = relationship("Like", back_populates="message", passive_deletes=True)
   # 关联评论
-  comments = relationship("Comment", back_populates="message")
+  comments = relationship("Comment", back_populates="message", passive_deletes=True)
 
 # 点赞表
 class Like(Base):
   __tablename__ = "likes"
+  # 使用AUTOINCREMENT，已归档记录的ID不会被新记录复用
+  __table_args__ = {"sqlite_autoincrement": True}
 
   id = Column(Integer, primary_key=True, index=True, comment="点赞ID")
-  user_id = Column(Integer, ForeignKey("users.id"), nullable=False, comment="用户ID")
-  message_id = Column(Integer, ForeignKey("messages.id"), nullable=False, comment="留言ID")
+  user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="用户ID")
+  message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True, comment="留言ID")
   created_at = Column(DateTime, default=lambda:datetime.now(BEIJING_TZ), comment="点赞时间")
 
   # 关联用户和留言
@@ -64,12 +70,57 @@ class Like(Base):
 # 评论表
 class Comment(Base):
   __tablename__ = "comments"
+  # 使用AUTOINCREMENT，已归档记录的ID不会被新记录复用
+  __table_args__ = {"sqlite_autoincrement": True}
   id = Column(Integer, primary_key=True, index=True, comment="评论ID")
   content = Column(Text, nullable=False, comment="评论内容")
-  author_id = Column(Integer, ForeignKey("users.id"), nullable=False, comment="评论者ID")
-  message_id = Column(Integer, ForeignKey("messages.id"), nullable=False, comment="留言ID")
+  author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="评论者ID")
+  message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True, comment="留言ID")
   created_at = Column(DateTime, default=lambda:datetime.now(BEIJING_TZ), comment="评论时间")
 
   # 关联用户和留言
   author = relationship("User", back_populates="comments")
   message = relationship("Message", back_populates="comments")
+
+# 归档留言表（超过保留期的留言移到归档表，保留点赞数和评论数汇总）
+class ArchivedMessage(Base):
+  __tablename__ = "archived_messages"
+  id = Column(Integer, primary_key=True, comment="留言ID")
+  content = Column(Text, nullable=False, comment="留言内容")
+  author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="作者ID")
+  created_at = Column(DateTime, index=True, comment="创建时间")
+  likes_count = Column(Integer, default=0, nullable=False, comment="点赞数")
+  comments_count = Column(Integer, default=0, nullable=False, comment="评论数")
+
+  # 关联用户
+  author = relationship("User")
+
+# 归档点赞表
+class ArchivedLike(Base):
+  __tablename__ = "archived_likes"
+  id = Column(Integer, primary_key=True, comment="点赞ID")
+  user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="用户ID")
+  message_id = Column(Integer, ForeignKey("archived_messages.id", ondelete="CASCADE"), nullable=False, index=True, comment="留言ID")
+  created_at = Column(DateTime, comment="点赞时间")
+
+# 归档评论表
+class ArchivedComment(Base):
+  __tablename__ = "archived_comments"
+  id = Column(Integer, primary_key=True, comment="评论ID")
+  content = Column(Text, nullable=False, comment="评论内容")
+  author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="评论者ID")
+  message_id = Column(Integer, ForeignKey("archived_messages.id", ondelete="CASCADE"), nullable=False, index=True, comment="留言ID")
+  created_at = Column(DateTime, comment="评论时间")
+
+  # 关联用户
+  author = relationship("User")
+
+# 后台任务表（持久化未完成的后台任务，重启后继续执行）
+class JobRecord(Base):
+  __tablename__ = "jobs"
+  id = Column(Integer, primary_key=True, index=True, comment="任务ID")
+  name = Column(String(50), nullable=False, comment="任务名称")
+  payload = Column(Text, nullable=False, comment="任务参数(JSON)")
+  status = Column(String(10), default="pending", nullable=False, index=True, comment="任务状态 pending|failed")
+  error = Column(Text, default="", comment="失败原因")
+  created_at = Column(DateTime, default=lambda:datetime.now(BEIJING_TZ), comment="创建时间")
@@ -0,0 +1,71 @@
+from models import Message, Like, Comment, ArchivedMessage, ArchivedLike, ArchivedComment
+from cache import liked_cache
+from ranking import rebuild_hot_scores
+from dotenv import load_dotenv
+import os
+# 加载.env文件
+load_dotenv()
+# 批量删除时每个事务处理的记录数（SQLite单条语句参数数量有限制）
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
+# 批量删除留言
+# 按ID分批选出符合条件的留言，每批一条DELETE语句一个事务，
+# 点赞和评论由外键ON DELETE CASCADE在数据库内级联删除
+def delete_messages(db, criteria: list, message_ids=None) -> dict:
+  result = {"deleted_messages": 0, "deleted_likes": 0, "deleted_comments": 0}
+  if message_ids:
+    # 指定了ID列表时按列表分批，空列表视为未指定
+    message_ids = sorted(set(message_ids))
+    for start in range(0, len(message_ids), BULK_CHUNK_SIZE):
+      chunk = message_ids[start:start + BULK_CHUNK_SIZE]
+      ids = [row[0] for row in db.query(Message.id).filter(Message.id.in_(chunk), *criteria)]
+      _delete_message_chunk(db, ids, result)
+    return result
+  last_id = 0
+  while True:
+    ids = [row[0] for row in db.query(Message.id).filter(
+      Message.id > last_id, *criteria
+    ).order_by(Message.id).limit(BULK_CHUNK_SIZE)]
+    if not ids:
+      return result
+    last_id = ids[-1]
+    _delete_message_chunk(db, ids, result)
+
+def _delete_message_chunk(db, ids: list, result: dict):
+  if not ids:
+    return
+  # 统计将被级联删除的数量
+  result["deleted_likes"] += db.query(Like).filter(Like.message_id.in_(ids)).count()
+  result["deleted_comments"] += db.query(Comment).filter(Comment.message_id.in_(ids)).count()
+  result["deleted_messages"] += db.query(Message).filter(
+    Message.id.in_(ids)
+  ).delete(synchronize_session=False)
+  db.commit()
+  liked_cache.discard_messages(ids)
+
+# 删除用户的全部留言、点赞和评论（调用前应已禁用该用户）
+def purge_user_content(db, user_id: int) -> dict:
+  result = delete_messages(db, [Message.author_id == user_id])
+  # 该用户在他人留言下的点赞和评论，删除后需要重算这些留言的热度
+  affected = set()
+  for model, owner, key in ((Like, Like.user_id, "deleted_likes"),
+                            (Comment, Comment.author_id, "deleted_comments")):
+    while True:
+      rows = db.query(model.id, model.message_id).filter(owner == user_id).limit(BULK_CHUNK_SIZE).all()
+      if not rows:
+        break
+      affected.update(row[1] for row in rows)
+      result[key] += db.query(model).filter(
+        model.id.in_([row[0] for row in rows])
+      ).delete(synchronize_session=False)
+      db.commit()
+  liked_cache.invalidate(user_id)
+  rebuild_hot_scores(db, affected)
+  # 归档表中的内容（数量较少，直接删除）
+  db.query(ArchivedLike).filter(ArchivedLike.user_id == user_id).delete(synchronize_session=False)
+  db.query(ArchivedComment).filter(ArchivedComment.author_id == user_id).delete(synchronize_session=False)
+  result["deleted_messages"] += db.query(ArchivedMessage).filter(
+    ArchivedMessage.author_id == user_id
+  ).delete(synchronize_session=False)
+  db.commit()
+  return result
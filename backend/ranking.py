@@ -0,0 +1,79 @@
+from datetime import datetime
+from dotenv import load_dotenv
+import math
+import os
+# 加载.env文件
+load_dotenv()
+# 热度半衰期（小时），每经过一个半衰期互动的权重减半
+HOT_HALF_LIFE_HOURS = float(os.getenv("HOT_HALF_LIFE_HOURS", "12"))
+# 每秒的衰减系数
+HOT_DECAY = math.log(2) / (HOT_HALF_LIFE_HOURS * 3600)
+# 各类互动的权重 发布留言本身也计一次
+POST_WEIGHT = 1.0
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+
+# 热度分数说明
+# 留言热度 = Σ 权重 * exp(-HOT_DECAY * (当前时间 - 互动时间))
+# 所有留言同乘exp(-HOT_DECAY * 当前时间)，排名与当前时间无关，
+# 因此数据库只需保存 log(Σ 权重 * exp(HOT_DECAY * 互动时间))，
+# 互动发生时增量更新，无需定时重算，按索引倒序取前K条即为热门榜
+# 使用对数形式保存避免指数溢出
+
+# 将时间转换为时间戳，数据库中取出的时间不带时区按北京时间处理
+def to_timestamp(value=None) -> float:
+  if value is None:
+    return datetime.now().timestamp()
+  if value.tzinfo is None:
+    from models import BEIJING_TZ
+    value = value.replace(tzinfo=BEIJING_TZ)
+  return value.timestamp()
+
+# 新留言的初始热度分数
+def initial_hot_score() -> float:
+  return math.log(POST_WEIGHT) + HOT_DECAY * to_timestamp()
+
+# 增加一次互动后的热度分数
+def add_event(score, weight: float, at=None) -> float:
+  event = math.log(weight) + HOT_DECAY * to_timestamp(at)
+  if score is None:
+    return event
+  high, low = max(score, event), min(score, event)
+  return high + math.log1p(math.exp(low - high))
+
+# 撤销一次互动后的热度分数（如取消点赞）
+def remove_event(score, weight: float, at=None) -> float:
+  event = math.log(weight) + HOT_DECAY * to_timestamp(at)
+  if score is None:
+    return None
+  if event >= score:
+    # 精度误差导致无剩余热度时，保留一个极小值
+    return score + math.log(1e-9)
+  return score + math.log1p(-math.exp(event - score))
+
+# 根据点赞和评论记录重新计算留言的热度分数（用于旧数据升级、批量删除后修复）
+# message_ids为空时重算所有留言
+def rebuild_hot_scores(db, message_ids=None):
+  from models import Message, Like, Comment
+  if message_ids is None:
+    _rebuild_hot_scores(db, Message, Like, Comment, None)
+    return
+  message_ids = list(message_ids)
+  # 分批处理，避免超出SQLite参数数量限制
+  for start in range(0, len(message_ids), 500):
+    _rebuild_hot_scores(db, Message, Like, Comment, message_ids[start:start + 500])
+
+def _rebuild_hot_scores(db, Message, Like, Comment, message_ids):
+  def scoped(query, column):
+    return query if message_ids is None else query.filter(column.in_(message_ids))
+  scores = {}
+  for message_id, created_at in scoped(db.query(Message.id, Message.created_at), Message.id):
+    scores[message_id] = add_event(None, POST_WEIGHT, created_at)
+  for model, weight in ((Like, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+    for message_id, created_at in scoped(db.query(model.message_id, model.created_at), model.message_id):
+      if message_id in scores:
+        scores[message_id] = add_event(scores[message_id], weight, created_at)
+  db.bulk_update_mappings(Message, [
+    {"id": message_id, "hot_score": score} for message_id, score in scores.items()
+  ])
+  db.commit()
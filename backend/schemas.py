@@ -103,4 +103,17 @@ class CommentResponse(BaseModel):
     message_id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# 批量删除留言模式（条件之间为且关系，至少提供一个条件）
+class BulkDeleteMessages(BaseModel):
+    message_ids: Optional[list[int]] = Field(None, max_length=10000, description="留言ID列表")
+    author_id: Optional[int] = Field(None, description="作者ID")
+    start_time: Optional[datetime] = Field(None, description="起始时间(含)")
+    end_time: Optional[datetime] = Field(None, description="结束时间(不含)")
+
+# 批量删除结果模式
+class BulkDeleteResponse(BaseModel):
+    deleted_messages: int = 0
+    deleted_likes: int = 0
+    deleted_comments: int = 0
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from limits import ConcurrencyLimiter
+
+ROUTE_LIMITS = {"auth": 1, "writes": 1, "reads": 2, "admin": 1}
+ROUTE_TIMEOUTS = {"auth": 1, "writes": 1, "reads": 1, "admin": 1}
+
+def make_limiter(queue_timeout: float, max_concurrent: int = 10) -> ConcurrencyLimiter:
+  return ConcurrencyLimiter(max_concurrent, dict(ROUTE_LIMITS), dict(ROUTE_TIMEOUTS), queue_timeout)
+
+# 超时为0时空闲名额应直接获取，名额用完后立即拒绝
+def test_zero_queue_timeout_admits_free_slots_and_sheds_rest():
+  async def run():
+    limiter = make_limiter(queue_timeout=0)
+    return [await limiter.acquire("reads") for _ in range(3)], limiter.stats()["routes"]["reads"]
+  results, stats = asyncio.run(run())
+  assert results == [True, True, False]
+  assert stats["admitted"] == 2
+  assert stats["shed"] == 1
+
+# 接口类别名额空闲但全局名额用完时按全局限制拒绝
+def test_zero_queue_timeout_respects_global_limit():
+  async def run():
+    limiter = make_limiter(queue_timeout=0, max_concurrent=1)
+    return [await limiter.acquire("reads"), await limiter.acquire("writes")]
+  assert asyncio.run(run()) == [True, False]
+
+# 释放名额后排队的请求可以获得名额
+def test_waiting_request_admitted_after_release():
+  async def run():
+    limiter = make_limiter(queue_timeout=1)
+    assert await limiter.acquire("writes")
+    waiter = asyncio.create_task(limiter.acquire("writes"))
+    await asyncio.sleep(0.01)
+    limiter.release("writes")
+    return await waiter
+  assert asyncio.run(run()) is True
@@ -0,0 +1,151 @@
+# 留言墙数据导出/导入工具
+# 导出：python transfer.py export backup.ndjson.gz
+# 导入：python transfer.py import backup.ndjson.gz
+# 每行一条JSON记录，_table字段为表名，其余字段为原始列值（保留ID）
+# 文件名以.gz结尾时使用gzip压缩，导出和导入均按批流式处理，内存占用与数据量无关
+# 导出在单个读事务中完成，各表数据来自同一快照，可直接对运行中的节点导出
+from database import Base, engine
+from models import Message
+from ranking import rebuild_hot_scores
+from sqlalchemy.orm import Session
+import argparse
+import gzip
+import json
+import time
+import sys
+
+# 导出的表，按外键依赖顺序排列（导入时先父表后子表）
+TABLES = ["users", "messages", "likes", "comments",
+          "archived_messages", "archived_likes", "archived_comments"]
+# 导出时每批读取的行数
+EXPORT_BATCH_SIZE = 5000
+# 导入时每次executemany的行数
+IMPORT_BATCH_SIZE = 10000
+# 导入时每个事务提交的行数
+IMPORT_COMMIT_ROWS = 200000
+
+def open_file(path: str, mode: str):
+  if path.endswith(".gz"):
+    return gzip.open(path, mode + "t", encoding="utf-8")
+  return open(path, mode, encoding="utf-8")
+
+# 打印处理速度
+def report(table: str, rows: int, started: float):
+  elapsed = time.perf_counter() - started
+  rate = rows / elapsed if elapsed > 0 else 0
+  print(f"{table}: {rows} 行, {elapsed:.2f} 秒, {rate:.0f} 行/秒", file=sys.stderr)
+
+# 导出：服务端游标按批读取（yield_per），逐行写出
+# 所有表在同一个读事务中读取，导出结果是同一时刻的一致快照，
+# 导出期间提交的写入不会出现在文件中（回滚日志模式下读事务会阻塞写入提交，建议主库使用WAL模式）
+def export_data(path: str):
+  with open_file(path, "w") as output, engine.connect() as conn:
+    # pysqlite不会为SELECT自动开启事务，需显式BEGIN
+    conn.exec_driver_sql("BEGIN")
+    try:
+      for table in TABLES:
+        export_table(conn, output, table)
+    except Exception:
+      conn.rollback()
+      raise
+    conn.commit()
+
+def export_table(conn, output, table: str):
+  columns = [column.name for column in Base.metadata.tables[table].columns]
+  started = time.perf_counter()
+  rows = 0
+  result = conn.execution_options(yield_per=EXPORT_BATCH_SIZE).exec_driver_sql(
+    f"SELECT {', '.join(columns)} FROM {table} ORDER BY id"
+  )
+  for partition in result.partitions():
+    for row in partition:
+      record = {"_table": table}
+      record.update(zip(columns, row))
+      output.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+      output.write("\n")
+    rows += len(partition)
+  report(table, rows, started)
+
+# 导入：按批executemany插入，每IMPORT_COMMIT_ROWS行提交一次事务
+def import_data(path: str, skip_existing: bool = False):
+  Base.metadata.create_all(bind=engine)
+  verb = "INSERT OR IGNORE" if skip_existing else "INSERT"
+  raw = engine.raw_connection()
+  try:
+    cursor = raw.cursor()
+    state = {"table": None, "columns": None, "batch": [], "rows": 0, "uncommitted": 0, "started": 0.0}
+
+    def flush():
+      if not state["batch"]:
+        return
+      columns = state["columns"]
+      cursor.executemany(
+        f"{verb} INTO {state['table']} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        state["batch"]
+      )
+      state["rows"] += len(state["batch"])
+      state["uncommitted"] += len(state["batch"])
+      state["batch"] = []
+      if state["uncommitted"] >= IMPORT_COMMIT_ROWS:
+        raw.commit()
+        state["uncommitted"] = 0
+
+    def finish_table():
+      flush()
+      if state["table"] is not None:
+        raw.commit()
+        state["uncommitted"] = 0
+        report(state["table"], state["rows"], state["started"])
+
+    with open_file(path, "r") as source:
+      for line in source:
+        if not line.strip():
+          continue
+        record = json.loads(line)
+        table = record.pop("_table")
+        if table not in TABLES:
+          raise ValueError(f"未知的表: {table}")
+        if table != state["table"]:
+          finish_table()
+          # 列名会拼接进INSERT语句，只允许ORM中定义的列
+          unknown = set(record) - set(Base.metadata.tables[table].columns.keys())
+          if unknown:
+            raise ValueError(f"{table} 表中未知的列: {', '.join(sorted(unknown))}")
+          state.update(table=table, columns=list(record), rows=0, started=time.perf_counter())
+        elif not record.keys() <= set(state["columns"]):
+          raise ValueError(f"{table} 表中未知的列: {', '.join(sorted(set(record) - set(state['columns'])))}")
+        state["batch"].append(tuple(record.get(column) for column in state["columns"]))
+        if len(state["batch"]) >= IMPORT_BATCH_SIZE:
+          flush()
+      finish_table()
+    cursor.close()
+  except Exception:
+    raw.rollback()
+    raise
+  finally:
+    raw.close()
+  # 旧版本导出的数据没有热度分数，导入后补算
+  with Session(engine) as db:
+    missing = [row[0] for row in db.query(Message.id).filter(Message.hot_score.is_(None))]
+    if missing:
+      rebuild_hot_scores(db, missing)
+
+def main():
+  parser = argparse.ArgumentParser(description="留言墙数据导出/导入工具（NDJSON格式）")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  export_parser = subparsers.add_parser("export", help="导出数据")
+  export_parser.add_argument("path", help="输出文件，.gz结尾时压缩")
+  import_parser = subparsers.add_parser("import", help="导入数据（保留原ID）")
+  import_parser.add_argument("path", help="输入文件，.gz结尾时解压")
+  import_parser.add_argument("--skip-existing", action="store_true", help="跳过ID已存在的记录")
+  args = parser.parse_args()
+
+  started = time.perf_counter()
+  if args.command == "export":
+    export_data(args.path)
+  else:
+    import_data(args.path, args.skip_existing)
+  print(f"完成，共耗时 {time.perf_counter() - started:.2f} 秒", file=sys.stderr)
+
+if __name__ == "__main__":
+  main()